@@ -0,0 +1,7 @@
+#!/usr/bin/env python
+### Launcher importing webhook, so its mypyc compiled build (mypyc webhook.py) is used when present
+### (running webhook.py directly always runs the source)
+import webhook
+
+if __name__ == "__main__":
+    webhook.main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+import os, asyncio, orjson, uvloop
+from aiohttp import web
+from webhook import logger, handle_event
+
+### Server listening consts (local only by default, the webhook caller POSTs here)
+server_host = os.getenv('SERVER_HOST', '127.0.0.1')
+server_port = int(os.getenv('SERVER_PORT', '8080'))
+
+### Handle a Github webhook payload POSTed as request body
+async def handle_request(request: web.Request) -> web.Response:
+    try:
+        event = orjson.loads(await request.read())
+    except orjson.JSONDecodeError as detail:
+        logger.error('can not decode event: %s', detail)
+        return web.Response(status=400, text='malformed payload')
+
+    ### handle_event blocks on the Github API, run it off the event loop
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, handle_event, event)
+    except Exception as detail:
+        logger.error('can not handle event: %s', detail)
+        return web.Response(status=500, text='can not handle event')
+
+    return web.Response(status=204)
+
+def main() -> None:
+    uvloop.install()
+    app = web.Application()
+    app.router.add_post('/', handle_request)
+    logger.info('server listening on %s:%d', server_host, server_port)
+    web.run_app(app, host=server_host, port=server_port, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 #!/usr/bin/env python
-import os, sys, json, logging, requests
+import os, sys, json, queue, atexit, asyncio, logging, threading, concurrent.futures, requests, orjson, aiohttp, uvloop
 from enum import Enum
-from logging.handlers import RotatingFileHandler
-from discord_webhook import DiscordWebhook, DiscordEmbed
+from typing import Iterator, Optional
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cachetools import cached, TTLCache
+from discord_webhook import DiscordEmbed
 
 ### Rotating logs consts
 log_path = os.getenv('LOG_PATH', '/tmp/discord-webhook-logs')
@@ -10,13 +14,43 @@ max_logfile_bytes = 42 * 1024 * 1024 # 42MB
 max_logfile_archives = 5
 
 ### Webhook URL consts
-github_external = os.getenv('DISCORD_WEBHOOK_EXTERNAL')
-github_staff = os.getenv('DISCORD_WEBHOOK_STAFF')
+github_external = os.getenv('DISCORD_WEBHOOK_EXTERNAL', '')
+github_staff = os.getenv('DISCORD_WEBHOOK_STAFF', '')
 
 ### Github token for cheking author permission (staff or external)
 ### This token needs 'public_repo' scope (or 'repo' for private repos)
 github_api_token = os.getenv('GITHUB_API_TOKEN')
 
+### Github API request consts
+github_api_timeout = 5 # seconds
+
+### Github permissions considered as staff
+staff_permissions = frozenset({'write', 'admin'})
+
+### HTTP status codes considered as success
+success_status_codes = frozenset({200, 204})
+
+### Author permission cache consts
+permission_cache_size = 1024
+permission_cache_ttl = 5 * 60 # 5 minutes
+
+### Discord delivery consts
+discord_queue_size = 10000
+discord_flush_timeout = 10 # seconds
+discord_request_timeout = 10 # seconds
+discord_max_connections = 64
+discord_keepalive_timeout = 60 # seconds
+discord_rate_limit_retries = 3
+
+### Discord batching consts (up to 10 embeds and 6000 chars per message)
+discord_batch_size = 10
+discord_batch_max_length = 6000
+discord_batch_delay = 0.05 # seconds
+
+### Discord embed limits (longer texts are rejected with a 400 for the whole message)
+discord_title_max_length = 256
+discord_description_max_length = 4096
+
 ### Enum of relevant event types (not exhaustive)
 class EventType(Enum):
     UNKNOWN                   = 0
@@ -68,15 +102,15 @@ class EventType(Enum):
 
 ### Enum of event type groups
 class EventTypeGroup(Enum):
-    COMMIT_COMMENT = [
+    COMMIT_COMMENT = frozenset({
         EventType.COMMIT_COMMENT
-    ]
-    ISSUE_COMMENT = [
+    })
+    ISSUE_COMMENT = frozenset({
         EventType.ISSUE_COMMENT_CREATED,
         EventType.ISSUE_COMMENT_EDITED,
         EventType.ISSUE_COMMENT_DELETED
-    ]
-    ISSUE = [
+    })
+    ISSUE = frozenset({
         EventType.ISSUE_OPENED,
         EventType.ISSUE_EDITED,
         EventType.ISSUE_DELETED,
@@ -93,8 +127,8 @@ class EventTypeGroup(Enum):
         EventType.ISSUE_TRANSFERRED,
         EventType.ISSUE_MILESTONED,
         EventType.ISSUE_DEMILESTONED,
-    ]
-    PULL_REQUEST = [
+    })
+    PULL_REQUEST = frozenset({
         EventType.PR_OPENED,
         EventType.PR_CLOSED,
         EventType.PR_REOPENED,
@@ -114,20 +148,27 @@ class EventTypeGroup(Enum):
         EventType.PR_AUTO_MERGE_DISABLED,
         EventType.PR_MILESTONED,
         EventType.PR_DEMILESTONED
-    ]
-    PULL_REQUEST_REVIEW = [
+    })
+    PULL_REQUEST_REVIEW = frozenset({
         EventType.PR_REVIEW_SUBMITTED,
         EventType.PR_REVIEW_EDITED,
         EventType.PR_REVIEW_DISMISSED
-    ]
-    PULL_REQUEST_REVIEW_COMMENT = [
+    })
+    PULL_REQUEST_REVIEW_COMMENT = frozenset({
         EventType.PR_REVIEW_COMMENT_CREATED,
         EventType.PR_REVIEW_COMMENT_EDITED,
         EventType.PR_REVIEW_COMMENT_DELETED
-    ]
+    })
+
+### Map each event type to its group
+event_type_group = {
+    event_type: group
+    for group in EventTypeGroup
+    for event_type in group.value
+}
 
 ### Event types whitelists
-staff_event_filter = [
+staff_event_filter = frozenset({
     EventType.ISSUE_OPENED,
     EventType.ISSUE_DELETED,
     EventType.ISSUE_CLOSED,
@@ -137,8 +178,8 @@ staff_event_filter = [
     EventType.PR_REOPENED,
     EventType.PR_READY_FOR_REVIEW,
     EventType.PR_REVIEW_SUBMITTED
-]
-external_event_filter = [
+})
+external_event_filter = frozenset({
     EventType.COMMIT_COMMENT,
     EventType.ISSUE_COMMENT_CREATED,
     EventType.ISSUE_OPENED,
@@ -151,305 +192,477 @@ external_event_filter = [
     EventType.PR_READY_FOR_REVIEW,
     EventType.PR_REVIEW_SUBMITTED,
     EventType.PR_REVIEW_COMMENT_CREATED
-]
+})
 
 ### User blacklist
-user_filter = [
+user_filter = frozenset({
     'github-actions[bot]'
-]
+})
 
 ### Repo blacklist
-repo_filter = [
+repo_filter = frozenset({
     'berty/bugs'
-]
+})
 
-### Setup global logger
+### Setup global logger (file writes are done by a background listener)
 logger = logging.getLogger('webhook')
 logger.setLevel(logging.INFO)
 log_handler = RotatingFileHandler(log_path, maxBytes=max_logfile_bytes, backupCount=max_logfile_archives)
 log_handler.setFormatter(logging.Formatter('%(asctime)-25s %(levelname)-10s %(message)s'))
-logger.addHandler(log_handler)
+log_queue: queue.Queue[logging.LogRecord] = queue.Queue(-1)
+logger.addHandler(QueueHandler(log_queue))
+log_listener = QueueListener(log_queue, log_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+### Setup Github API session (reuses connections across requests)
+github_session = requests.Session()
+github_session.headers['Authorization'] = 'token %s' % github_api_token
+github_session.mount('https://', HTTPAdapter(
+    pool_connections = 4,
+    pool_maxsize     = 10,
+    max_retries      = Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504], raise_on_status=False)
+))
+
+### Setup Discord delivery queue and event loop (run by a background thread)
+discord_queue: asyncio.Queue[Optional[tuple[str, DiscordEmbed]]] = asyncio.Queue(maxsize=discord_queue_size)
+discord_loop = uvloop.new_event_loop()
+
+### Event type lookup table keyed by (category, action)
+event_type_table = {
+    ('commit_comment', 'created'):                EventType.COMMIT_COMMENT,
+    ('issue_comment', 'created'):                 EventType.ISSUE_COMMENT_CREATED,
+    ('issue_comment', 'edited'):                  EventType.ISSUE_COMMENT_EDITED,
+    ('issue_comment', 'deleted'):                 EventType.ISSUE_COMMENT_DELETED,
+    ('issue', 'opened'):                          EventType.ISSUE_OPENED,
+    ('issue', 'edited'):                          EventType.ISSUE_EDITED,
+    ('issue', 'deleted'):                         EventType.ISSUE_DELETED,
+    ('issue', 'pinned'):                          EventType.ISSUE_PINNED,
+    ('issue', 'unpinned'):                        EventType.ISSUE_UNPINNED,
+    ('issue', 'closed'):                          EventType.ISSUE_CLOSED,
+    ('issue', 'reopened'):                        EventType.ISSUE_REOPENED,
+    ('issue', 'assigned'):                        EventType.ISSUE_ASSIGNED,
+    ('issue', 'unassigned'):                      EventType.ISSUE_UNASSIGNED,
+    ('issue', 'labeled'):                         EventType.ISSUE_LABELED,
+    ('issue', 'unlabeled'):                       EventType.ISSUE_UNLABELED,
+    ('issue', 'locked'):                          EventType.ISSUE_LOCKED,
+    ('issue', 'unlocked'):                        EventType.ISSUE_UNLOCKED,
+    ('issue', 'transferred'):                     EventType.ISSUE_TRANSFERRED,
+    ('issue', 'milestoned'):                      EventType.ISSUE_MILESTONED,
+    ('issue', 'demilestoned'):                    EventType.ISSUE_DEMILESTONED,
+    ('pull_request', 'opened'):                   EventType.PR_OPENED,
+    ('pull_request', 'edited'):                   EventType.PR_EDITED,
+    ('pull_request', 'closed'):                   EventType.PR_CLOSED,
+    ('pull_request', 'assigned'):                 EventType.PR_ASSIGNED,
+    ('pull_request', 'unassigned'):               EventType.PR_UNASSIGNED,
+    ('pull_request', 'review_requested'):         EventType.PR_REVIEW_REQUESTED,
+    ('pull_request', 'review_request_removed'):   EventType.PR_REVIEW_REQUEST_REMOVED,
+    ('pull_request', 'ready_for_review'):         EventType.PR_READY_FOR_REVIEW,
+    ('pull_request', 'converted_to_draft'):       EventType.PR_CONVERTED_TO_DRAFT,
+    ('pull_request', 'labeled'):                  EventType.PR_LABELED,
+    ('pull_request', 'unlabeled'):                EventType.PR_UNLABELED,
+    ('pull_request', 'synchronize'):              EventType.PR_SYNCHRONIZE,
+    ('pull_request', 'auto_merge_enabled'):       EventType.PR_AUTO_MERGE_ENABLED,
+    ('pull_request', 'auto_merge_disabled'):      EventType.PR_AUTO_MERGE_DISABLED,
+    ('pull_request', 'locked'):                   EventType.PR_LOCKED,
+    ('pull_request', 'unlocked'):                 EventType.PR_UNLOCKED,
+    ('pull_request', 'reopened'):                 EventType.PR_REOPENED,
+    ('pull_request', 'milestoned'):               EventType.PR_MILESTONED,
+    ('pull_request', 'demilestoned'):             EventType.PR_DEMILESTONED,
+    ('pull_request_review', 'submitted'):         EventType.PR_REVIEW_SUBMITTED,
+    ('pull_request_review', 'edited'):            EventType.PR_REVIEW_EDITED,
+    ('pull_request_review', 'dismissed'):         EventType.PR_REVIEW_DISMISSED,
+    ('pull_request_review_comment', 'created'):   EventType.PR_REVIEW_COMMENT_CREATED,
+    ('pull_request_review_comment', 'edited'):    EventType.PR_REVIEW_COMMENT_EDITED,
+    ('pull_request_review_comment', 'deleted'):   EventType.PR_REVIEW_COMMENT_DELETED,
+}
+
+### Determine event category from payload top-level keys
+### ('comment' is shared by several categories, so it is only probed once, empty if unknown)
+def get_event_category(event: dict) -> str:
+    has_comment = 'comment' in event
 
-def get_event_type(event):
     if 'issue' in event:
-        if 'comment' in event:
-            if event['action'] == 'created':
-                return EventType.ISSUE_COMMENT_CREATED
-            if event['action'] == 'edited':
-                return EventType.ISSUE_COMMENT_EDITED
-            if event['action'] == 'deleted':
-                return EventType.ISSUE_COMMENT_DELETED
-        else:
-            if event['action'] == 'opened':
-                return EventType.ISSUE_OPENED
-            if event['action'] == 'edited':
-                return EventType.ISSUE_EDITED
-            if event['action'] == 'deleted':
-                return EventType.ISSUE_DELETED
-            if event['action'] == 'pinned':
-                return EventType.ISSUE_PINNED
-            if event['action'] == 'unpinned':
-                return EventType.ISSUE_UNPINNED
-            if event['action'] == 'closed':
-                return EventType.ISSUE_CLOSED
-            if event['action'] == 'reopened':
-                return EventType.ISSUE_REOPENED
-            if event['action'] == 'assigned':
-                return EventType.ISSUE_ASSIGNED
-            if event['action'] == 'unassigned':
-                return EventType.ISSUE_UNASSIGNED
-            if event['action'] == 'labeled':
-                return EventType.ISSUE_LABELED
-            if event['action'] == 'unlabeled':
-                return EventType.ISSUE_UNLABELED
-            if event['action'] == 'locked':
-                return EventType.ISSUE_LOCKED
-            if event['action'] == 'unlocked':
-                return EventType.ISSUE_UNLOCKED
-            if event['action'] == 'transferred':
-                return EventType.ISSUE_TRANSFERRED
-            if event['action'] == 'milestoned':
-                return EventType.ISSUE_MILESTONED
-            if event['action'] == 'demilestoned':
-                return EventType.ISSUE_DEMILESTONED
+        if has_comment:
+            return 'issue_comment'
+        return 'issue'
     elif 'pull_request' in event:
-        if 'comment' in event:
-            if event['action'] == 'created':
-                return EventType.PR_REVIEW_COMMENT_CREATED
-            if event['action'] == 'edited':
-                return EventType.PR_REVIEW_COMMENT_EDITED
-            if event['action'] == 'deleted':
-                return EventType.PR_REVIEW_COMMENT_DELETED
+        if has_comment:
+            return 'pull_request_review_comment'
         elif 'number' in event:
-            if event['action'] == 'opened':
-                return EventType.PR_OPENED
-            if event['action'] == 'edited':
-                return EventType.PR_EDITED
-            if event['action'] == 'closed':
-                return EventType.PR_CLOSED
-            if event['action'] == 'assigned':
-                return EventType.PR_ASSIGNED
-            if event['action'] == 'unassigned':
-                return EventType.PR_UNASSIGNED
-            if event['action'] == 'review_requested':
-                return EventType.PR_REVIEW_REQUESTED
-            if event['action'] == 'review_request_removed':
-                return EventType.PR_REVIEW_REQUEST_REMOVED
-            if event['action'] == 'ready_for_review':
-                return EventType.PR_READY_FOR_REVIEW
-            if event['action'] == 'converted_to_draft':
-                return EventType.PR_CONVERTED_TO_DRAFT
-            if event['action'] == 'labeled':
-                return EventType.PR_LABELED
-            if event['action'] == 'unlabeled':
-                return EventType.PR_UNLABELED
-            if event['action'] == 'synchronize':
-                return EventType.PR_SYNCHRONIZE
-            if event['action'] == 'auto_merge_enabled':
-                return EventType.PR_AUTO_MERGE_ENABLED
-            if event['action'] == 'auto_merge_disabled':
-                return EventType.PR_AUTO_MERGE_DISABLED
-            if event['action'] == 'locked':
-                return EventType.PR_LOCKED
-            if event['action'] == 'unlocked':
-                return EventType.PR_UNLOCKED
-            if event['action'] == 'reopened':
-                return EventType.PR_REOPENED
+            return 'pull_request'
         elif 'review' in event:
-            if event['action'] == 'submitted':
-                return EventType.PR_REVIEW_SUBMITTED
-            if event['action'] == 'edited':
-                return EventType.PR_REVIEW_EDITED
-            if event['action'] == 'dismissed':
-                return EventType.PR_REVIEW_DISMISSED
-    elif 'comment' in event and 'commit_id' in event['comment']:
-        if event['action'] == 'created':
-            return EventType.COMMIT_COMMENT
+            return 'pull_request_review'
+    elif has_comment and 'commit_id' in event['comment']:
+        return 'commit_comment'
+    return ''
+
+def get_event_type(event: dict) -> EventType:
+    event_type = event_type_table.get((get_event_category(event), event.get('action', '')), EventType.UNKNOWN)
 
-    logger.warning('UNKNOWN event received: %s', json.dumps(event))
+    if event_type is EventType.UNKNOWN and logger.isEnabledFor(logging.WARNING):
+        logger.warning('UNKNOWN event received: %s', event.get('action'))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('UNKNOWN event payload: %s', json.dumps(event))
 
-    return EventType.UNKNOWN
+    return event_type
+
+### Actions for which the event body is used as embed description
+described_actions = frozenset({'opened', 'edited', 'created', 'submitted'})
+
+### Actions for which issue and pull request embeds are highlighted
+opened_actions = frozenset({'opened', 'reopened'})
+
+### Color codes of common actions
+action_colors = {
+    'closed':    0x202225,
+    'deleted':   0x202225,
+    'dismissed': 0x202225,
+    'edited':    0x373B40
+}
 
 ### Convert common actions to color code
-def action_to_color(action):
-    if action in ['closed', 'deleted', 'dismissed']:
-        return '202225'
-    if action == 'edited':
-        return '373B40'
-    return '2F3136'
+def action_to_color(action: str) -> int:
+    return action_colors.get(action, 0x2F3136)
 
-### Convert event to embed message
-def parse_event(event_type, event):
+### Create embed message with common attributes set
+### (attributes are assigned directly, in the form the set_* methods store them)
+def new_embed(sender: dict, action: str) -> DiscordEmbed:
     embed = DiscordEmbed()
 
     ### Set author (common)
-    embed.set_author(
-        name     = event['sender']['login'],
-        url      = event['sender']['html_url'],
-        icon_url = event['sender']['avatar_url']
-    )
+    embed.author = {
+        'name':     sender['login'],
+        'url':      sender['html_url'],
+        'icon_url': sender['avatar_url']
+    }
 
     ### Set embed color (common)
-    embed.set_color(action_to_color(event['action']))
-
-    ### Parse event group specific attributes
-    if event_type in EventTypeGroup.COMMIT_COMMENT.value:
-        title = '[{repo}] Commit comment {action}: {commit_id}'.format(
-            repo      = event['repository']['full_name'],
-            action    = event['action'],
-            commit_id = event['comment']['commit_id']
-        )
-        embed.set_title(title)
-        embed.set_url(event['comment']['html_url'])
-        embed.set_description(event['comment']['body'])
-        embed.set_color('EAF0F3')
-
-    elif event_type in EventTypeGroup.ISSUE_COMMENT.value:
-        title = '[{repo}] Issue comment {action}: #{number} {title}'.format(
-            repo   = event['repository']['full_name'],
-            action = event['action'],
-            number = event['issue']['number'],
-            title  = event['issue']['title']
-        )
-        embed.set_title(title)
-        embed.set_url(event['comment']['html_url'])
-        if event['action'] in ['created', 'edited']:
-            embed.set_description(event['comment']['body'])
-        if event['action'] == 'created':
-            embed.set_color('DAD100')
-
-    elif event_type in EventTypeGroup.ISSUE.value:
-        title = '[{repo}] Issue {action}: #{number} {title}'.format(
-            repo   = event['repository']['full_name'],
-            action = event['action'],
-            number = event['issue']['number'],
-            title  = event['issue']['title']
-        )
-        embed.set_title(title)
-        embed.set_url(event['issue']['html_url'])
-        if event['action'] in ['opened', 'edited']:
-            embed.set_description(event['issue']['body'])
-        if event['action'] in ['opened', 'reopened']:
-            embed.set_color('EB6420')
-
-    elif event_type in EventTypeGroup.PULL_REQUEST.value:
-        title = '[{repo}] Pull request {action}: #{number} {title}'.format(
-            repo   = event['repository']['full_name'],
-            action = event['action'],
-            number = event['pull_request']['number'],
-            title  = event['pull_request']['title']
-        )
-        embed.set_title(title)
-        embed.set_url(event['pull_request']['html_url'])
-        if event['action'] in ['opened', 'edited']:
-            embed.set_description(event['pull_request']['body'])
-        if event['action'] in ['opened', 'reopened']:
-            embed.set_color('009801')
-
-    elif event_type in EventTypeGroup.PULL_REQUEST_REVIEW.value:
-        title = '[{repo}] Pull request review {action}: #{number} {title}'.format(
-            repo   = event['repository']['full_name'],
-            action = event['action'],
-            number = event['pull_request']['number'],
-            title  = event['pull_request']['title']
-        )
-        embed.set_title(title)
-        embed.set_url(event['review']['html_url'])
-        if event['action'] in ['submitted', 'edited']:
-            embed.set_description(event['review']['body'])
-        if event['action'] == 'submitted':
-            embed.set_color('03B2F8')
-
-    elif event_type in EventTypeGroup.PULL_REQUEST_REVIEW_COMMENT.value:
-        title = '[{repo}] Pull request review comment {action}: #{number} {title}'.format(
-            repo   = event['repository']['full_name'],
-            action = event['action'],
-            number = event['pull_request']['number'],
-            title  = event['pull_request']['title']
-        )
-        embed.set_title(title)
-        embed.set_url(event['comment']['html_url'])
-        desc = '''
-        **{path}**
+    embed.color = action_to_color(action)
+
+    return embed
+
+### Convert commit comment event to embed message
+def parse_commit_comment(event: dict) -> DiscordEmbed:
+    action = event['action']
+    repo = event['repository']['full_name']
+    comment = event['comment']
+
+    embed = new_embed(event['sender'], action)
+    embed.set_title(f"[{repo}] Commit comment {action}: {comment['commit_id']}")
+    embed.set_url(comment['html_url'])
+    embed.set_description(comment['body'])
+    embed.set_color('EAF0F3')
+
+    return embed
+
+### Convert issue comment event to embed message
+def parse_issue_comment(event: dict) -> DiscordEmbed:
+    action = event['action']
+    repo = event['repository']['full_name']
+    issue = event['issue']
+    comment = event['comment']
+
+    embed = new_embed(event['sender'], action)
+    embed.set_title(f"[{repo}] Issue comment {action}: #{issue['number']} {issue['title']}")
+    embed.set_url(comment['html_url'])
+    if action in described_actions:
+        embed.set_description(comment['body'])
+    if action == 'created':
+        embed.set_color('DAD100')
+
+    return embed
+
+### Convert issue event to embed message
+def parse_issue(event: dict) -> DiscordEmbed:
+    action = event['action']
+    repo = event['repository']['full_name']
+    issue = event['issue']
+
+    embed = new_embed(event['sender'], action)
+    embed.set_title(f"[{repo}] Issue {action}: #{issue['number']} {issue['title']}")
+    embed.set_url(issue['html_url'])
+    if action in described_actions:
+        embed.set_description(issue['body'])
+    if action in opened_actions:
+        embed.set_color('EB6420')
+
+    return embed
+
+### Convert pull request event to embed message
+def parse_pr(event: dict) -> DiscordEmbed:
+    action = event['action']
+    repo = event['repository']['full_name']
+    pr = event['pull_request']
+
+    embed = new_embed(event['sender'], action)
+    embed.set_title(f"[{repo}] Pull request {action}: #{pr['number']} {pr['title']}")
+    embed.set_url(pr['html_url'])
+    if action in described_actions:
+        embed.set_description(pr['body'])
+    if action in opened_actions:
+        embed.set_color('009801')
+
+    return embed
+
+### Convert pull request review event to embed message
+def parse_pr_review(event: dict) -> DiscordEmbed:
+    action = event['action']
+    repo = event['repository']['full_name']
+    pr = event['pull_request']
+    review = event['review']
+
+    embed = new_embed(event['sender'], action)
+    embed.set_title(f"[{repo}] Pull request review {action}: #{pr['number']} {pr['title']}")
+    embed.set_url(review['html_url'])
+    if action in described_actions:
+        embed.set_description(review['body'])
+    if action == 'submitted':
+        embed.set_color('03B2F8')
+
+    return embed
+
+### Convert pull request review comment event to embed message
+def parse_pr_review_comment(event: dict) -> DiscordEmbed:
+    action = event['action']
+    repo = event['repository']['full_name']
+    pr = event['pull_request']
+    comment = event['comment']
+
+    embed = new_embed(event['sender'], action)
+    embed.set_title(f"[{repo}] Pull request review comment {action}: #{pr['number']} {pr['title']}")
+    embed.set_url(comment['html_url'])
+    if action in described_actions:
+        embed.set_description(f'''
+        **{comment['path']}**
         ```diff
-        {diff}
+        {comment['diff_hunk']}
         ```
-        {comment}
-        '''.format(
-            path    = event['comment']['path'],
-            diff    = event['comment']['diff_hunk'],
-            comment = event['comment']['body']
-        )
-        if event['action'] in ['created', 'edited']:
-            embed.set_description(desc)
-        if event['action'] == 'created':
-            embed.set_color('6ED5FF')
+        {comment['body']}
+        ''')
+    if action == 'created':
+        embed.set_color('6ED5FF')
 
     return embed
 
-## Check via Github API if event author is a staff of the event repo
-def is_author_staff(event):
-    url = 'https://api.github.com/repos/%s/collaborators/%s/permission' % (event['repository']['full_name'], event['sender']['login'])
-    headers = {'Authorization': 'token %s' % github_api_token}
-    response = requests.get(url, headers=headers)
+### Map each event type to its group specific parser
+group_parsers = {
+    EventTypeGroup.COMMIT_COMMENT:              parse_commit_comment,
+    EventTypeGroup.ISSUE_COMMENT:               parse_issue_comment,
+    EventTypeGroup.ISSUE:                       parse_issue,
+    EventTypeGroup.PULL_REQUEST:                parse_pr,
+    EventTypeGroup.PULL_REQUEST_REVIEW:         parse_pr_review,
+    EventTypeGroup.PULL_REQUEST_REVIEW_COMMENT: parse_pr_review_comment,
+}
+event_parsers = {
+    event_type: group_parsers[group]
+    for event_type, group in event_type_group.items()
+}
 
-    if response.status_code not in [200, 204]:
+### Convert event to embed message
+def parse_event(event_type: EventType, event: dict) -> DiscordEmbed:
+    return event_parsers[event_type](event)
+
+## Fetch via Github API the permission of user on repo (cached for a while)
+@cached(TTLCache(maxsize=permission_cache_size, ttl=permission_cache_ttl), lock=threading.Lock())
+def fetch_author_permission(repo: str, user: str) -> str:
+    url = 'https://api.github.com/repos/%s/collaborators/%s/permission' % (repo, user)
+    response = github_session.get(url, timeout=github_api_timeout)
+
+    if response.status_code not in success_status_codes:
         raise Exception(
             'author permission request failed: (code: %d), (text: %s), (repo: %s, user: %s)',
             response.status_code,
             response.text,
-            event['repository']['full_name'],
-            event['sender']['login']
+            repo,
+            user
         )
 
     try:
-        permission = json.loads(response.text)['permission']
-        if permission in ['write', 'admin']:
-            return True
-        return False
+        return orjson.loads(response.content)['permission']
     except:
         raise Exception(
             'author permission request response malformed: (text: %s), (repo: %s, user: %s)',
             response.text,
-            event['repository']['full_name'],
-            event['sender']['login']
+            repo,
+            user
         )
 
+## Check via Github API if event author is a staff of the event repo
+def is_author_staff(event: dict) -> bool:
+    permission = fetch_author_permission(event['repository']['full_name'], event['sender']['login'])
+    if permission in staff_permissions:
+        return True
+    return False
+
 
-### Send formated embed message to specified webhook url
-def send_to_discord(webhook_url, embed):
-    webhook = DiscordWebhook(url=webhook_url)
-    webhook.add_embed(embed)
-    responses = webhook.execute()
+### Convert embed message to Discord API JSON payload
+def embed_payload(embed: DiscordEmbed) -> dict:
+    return {key: value for key, value in vars(embed).items() if value is not None}
 
-    if type(responses) is not list: responses = [responses]
+### Deliver formated embed messages to specified webhook url
+async def deliver_to_discord(session: aiohttp.ClientSession, webhook_url: str, embeds: list[DiscordEmbed]) -> None:
+    payload = {'embeds': [embed_payload(embed) for embed in embeds]}
 
-    for response in responses:
-        if response.status_code not in [200, 204]:
+    try:
+        for attempt in range(discord_rate_limit_retries + 1):
+            async with session.post(webhook_url, json=payload) as response:
+                status = response.status
+                text = await response.text() if status not in success_status_codes else ''
+                retry_after = float(response.headers.get('Retry-After', 1))
+
+            ### Wait for the rate limit to reset then retry (Retry-After is in seconds)
+            if status != 429 or attempt == discord_rate_limit_retries:
+                break
+            logger.warning('discord rate limit hit: retrying in %.2fs', retry_after)
+            await asyncio.sleep(retry_after)
+    except Exception as detail:
+        logger.error('can not send event to discord: %s', detail)
+        return
+
+    if status not in success_status_codes:
+        for embed in embeds:
             logger.error(
                 'executing webhook failed: (code: %d), (text: %s), (author: %s, title: %s, description: %s)',
-                response.status_code,
-                response.text,
+                status,
+                text,
                 embed.author['name'],
                 embed.title,
                 embed.description
             )
-            return
+        return
 
-    logger.info('event sent to discord successfully: %s', embed.title)
+    if logger.isEnabledFor(logging.INFO):
+        for embed in embeds:
+            logger.info('event sent to discord successfully: %s', embed.title)
+
+### Deliver embed messages once the previous delivery to the same webhook url is done
+async def deliver_in_order(previous: Optional[asyncio.Task[None]], session: aiohttp.ClientSession, webhook_url: str, embeds: list[DiscordEmbed]) -> None:
+    if previous is not None:
+        await previous
+    await deliver_to_discord(session, webhook_url, embeds)
+
+### Cut text to fit in max_length chars, marking it with an ellipsis
+def truncate(text: Optional[str], max_length: int) -> Optional[str]:
+    if text is None or len(text) <= max_length:
+        return text
+    return text[:max_length - 1] + '…'
+
+### Cut embed message title and description to fit Discord embed limits
+def fit_embed(embed: DiscordEmbed) -> DiscordEmbed:
+    embed.title = truncate(embed.title, discord_title_max_length)
+    embed.description = truncate(embed.description, discord_description_max_length)
+    return embed
 
-def handle_event(event):
-    ### Determine event type
-    event_type = get_event_type(event)
+### Count the characters of an embed message that Discord limits
+def embed_length(embed: DiscordEmbed) -> int:
+    return len(embed.title or '') + len(embed.description or '') + len(embed.author['name'])
+
+### Group queued messages by webhook url, split to fit Discord message limits
+def batch_embeds(items: list[tuple[str, DiscordEmbed]]) -> Iterator[tuple[str, list[DiscordEmbed]]]:
+    embeds_by_url: dict[str, list[DiscordEmbed]] = {}
+    for webhook_url, embed in items:
+        embeds_by_url.setdefault(webhook_url, []).append(embed)
+
+    for webhook_url, embeds in embeds_by_url.items():
+        batch: list[DiscordEmbed] = []
+        batch_length = 0
+        for embed in embeds:
+            length = embed_length(embed)
+            if batch and (len(batch) == discord_batch_size or batch_length + length > discord_batch_max_length):
+                yield webhook_url, batch
+                batch, batch_length = [], 0
+            batch.append(embed)
+            batch_length += length
+        if batch:
+            yield webhook_url, batch
+
+### Deliver queued embed messages until a stop sentinel (None) is received
+async def discord_worker() -> None:
+    connector = aiohttp.TCPConnector(limit=discord_max_connections, keepalive_timeout=discord_keepalive_timeout)
+    timeout = aiohttp.ClientTimeout(total=discord_request_timeout)
+
+    async with aiohttp.ClientSession(
+        connector      = connector,
+        timeout        = timeout,
+        json_serialize = lambda payload: orjson.dumps(payload).decode()
+    ) as session:
+        ### Last delivery started for each webhook url
+        deliveries: dict[str, asyncio.Task[None]] = {}
+        running = True
+        while running:
+            ### Wait for a first message then gather the ones following it closely
+            items: list[tuple[str, DiscordEmbed]] = []
+            item = await discord_queue.get()
+            deadline = discord_loop.time() + discord_batch_delay
+            while item is not None:
+                items.append(item)
+                if len(items) == discord_batch_size:
+                    break
+                try:
+                    item = await asyncio.wait_for(discord_queue.get(), max(0, deadline - discord_loop.time()))
+                except asyncio.TimeoutError:
+                    break
+
+            running = item is not None
+
+            ### Post batches for different urls concurrently, but one at a time for a same url
+            ### so Discord shows them in order, without waiting for them to gather the next ones
+            for webhook_url, embeds in batch_embeds(items):
+                deliveries[webhook_url] = asyncio.create_task(
+                    deliver_in_order(deliveries.get(webhook_url), session, webhook_url, embeds)
+                )
+
+        ### Wait for in-flight deliveries before closing the session
+        await asyncio.gather(*deliveries.values())
+
+### Queue embed message in the event loop thread, dropping the oldest one if full
+def enqueue_to_discord(webhook_url: str, embed: DiscordEmbed) -> None:
+    if discord_queue.full():
+        dropped = discord_queue.get_nowait()
+        if dropped is not None:
+            logger.warning('discord queue full: event dropped: %s', dropped[1].title)
+    discord_queue.put_nowait((webhook_url, embed))
+
+### Queue formated embed message for delivery to specified webhook url (thread-safe)
+def send_to_discord(webhook_url: str, embed: DiscordEmbed) -> None:
+    discord_loop.call_soon_threadsafe(enqueue_to_discord, webhook_url, fit_embed(embed))
+
+### Wait for queued embed messages to be delivered before exiting
+def flush_discord_queue() -> None:
+    asyncio.run_coroutine_threadsafe(discord_queue.put(None), discord_loop)
+
+    try:
+        discord_worker_future.result(timeout=discord_flush_timeout)
+    except concurrent.futures.TimeoutError:
+        logger.error('flushing discord queue timed out: %d event(s) dropped', discord_queue.qsize())
+    except Exception as detail:
+        logger.error('discord worker failed: %s', detail)
 
+    discord_loop.call_soon_threadsafe(discord_loop.stop)
+
+### Start Discord delivery worker
+discord_thread = threading.Thread(target=discord_loop.run_forever, name='discord-worker', daemon=True)
+discord_thread.start()
+discord_worker_future = asyncio.run_coroutine_threadsafe(discord_worker(), discord_loop)
+atexit.register(flush_discord_queue)
+
+def handle_event(event: dict) -> None:
     ### Filter event accordingly to user and repo blacklists
-    if event['sender']['login'] in user_filter:
-        logger.info('user (%s) is in blacklist: event [%s] skipped', event['sender']['login'], event_type.name)
+    user = event['sender']['login']
+    repo = event['repository']['full_name']
+    if user in user_filter:
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('user (%s) is in blacklist: event (%s) skipped', user, event.get('action'))
         return
-    elif event['repository']['full_name'] in repo_filter:
-        logger.info('repo (%s) is in blacklist: event [%s] skipped', event['repository']['full_name'], event_type.name)
+    elif repo in repo_filter:
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('repo (%s) is in blacklist: event (%s) skipped', repo, event.get('action'))
         return
 
+    ### Determine event type
+    event_type = get_event_type(event)
+
     ### Check if event author is a staff user
     is_staff = is_author_staff(event)
 
@@ -460,15 +673,20 @@ def handle_event(event):
     elif not is_staff and event_type in external_event_filter:
         embed = parse_event(event_type, event)
         send_to_discord(github_external, embed)
-    else:
+    elif logger.isEnabledFor(logging.INFO):
         logger.info('event [%s] skipped for %s user', event_type.name, 'staff' if is_staff else 'external')
 
-if __name__ == "__main__":
+### Handle the Github webhook payload file passed as first arg
+### (when compiled with mypyc, run via ./run_webhook.py <payload> to use the compiled build)
+def main() -> None:
     ### Get the Github webhook payload from sys args
-    with open(sys.argv[1], 'r') as payload:
-        event = json.loads(payload.read())
+    with open(sys.argv[1], 'rb') as payload:
+        event = orjson.loads(payload.read())
 
     try:
         handle_event(event)
     except Exception as detail:
         logger.error('can not handle event: %s', detail)
+
+if __name__ == "__main__":
+    main()